@@ -14,6 +14,18 @@ def bconv1d(x, weight, stride=1, dilation=1, padding=0):
     return out.view(b, c, n, -1)
 
 
+def linear1d(x, weight, bias=None):
+    # x: b x n_in x t
+    # weight: n_out x n_in
+    # Applies the linear map over the neuron dim without permuting to b x t x n and back
+    if x.transpose(1, 2).is_contiguous():
+        # Time-major input (b x t x n in memory) collapses to a single (b * t) x n_in GEMM without copying
+        b, n, t = x.shape
+        return F.linear(x.transpose(1, 2).reshape(b * t, n), weight, bias).view(b, t, -1).transpose(1, 2)
+
+    return F.conv1d(x, weight.unsqueeze(2), bias)
+
+
 def cat(tensor_list):
     n = len(tensor_list[0])
     cat_tensors = [torch.cat([tensors[i] for tensors in tensor_list], dim=2) for i in range(n)]
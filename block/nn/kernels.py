@@ -0,0 +1,307 @@
+from typing import Optional, Tuple
+
+import torch
+import triton
+import triton.language as tl
+
+# The kernels are registered as custom ops, which older PyTorch builds lack. Raised as an ImportError so that importers
+# fall back to the PyTorch implementations as they do without triton
+if not hasattr(torch.library, "custom_op"):
+    raise ImportError("block.nn.kernels requires torch.library.custom_op (PyTorch >= 2.4)")
+
+
+_BLOCK = 128
+_ELEMENTWISE_BLOCK = 1024
+
+
+@triton.jit
+def _fast_sigmoid_fwd_kernel(input_ptr, out_ptr, denominator_ptr, scale, n_elements, BLOCK: tl.constexpr):
+    offsets = tl.program_id(0).to(tl.int64) * BLOCK + tl.arange(0, BLOCK)
+    valid = offsets < n_elements
+    x = tl.load(input_ptr + offsets, mask=valid).to(tl.float32)
+    tl.store(out_ptr + offsets, (x > 0).to(out_ptr.dtype.element_ty), mask=valid)
+    tl.store(denominator_ptr + offsets, (scale * tl.abs(x) + 1).to(tl.float16), mask=valid)
+
+
+@triton.jit
+def _fast_sigmoid_bwd_kernel(grad_output_ptr, denominator_ptr, grad_input_ptr, n_elements, BLOCK: tl.constexpr):
+    offsets = tl.program_id(0).to(tl.int64) * BLOCK + tl.arange(0, BLOCK)
+    valid = offsets < n_elements
+    grad_output = tl.load(grad_output_ptr + offsets, mask=valid).to(tl.float32)
+    denominator = tl.load(denominator_ptr + offsets, mask=valid, other=1.).to(tl.float32)
+    tl.store(grad_input_ptr + offsets, (grad_output / (denominator * denominator)).to(grad_input_ptr.dtype.element_ty), mask=valid)
+
+
+@triton.jit
+def _multistep_lif_fwd_kernel(current_ptr, beta_ptr, v_init_ptr, spikes_ptr, mem_ptr, pre_mem_ptr, mask_ptr,
+                              n_neurons, n, t_len, stride_cb, stride_cn, stride_ct, stride_beta,
+                              HAS_V_INIT: tl.constexpr, SINGLE_SPIKE: tl.constexpr, INTEGRATOR: tl.constexpr, BLOCK: tl.constexpr):
+    # Each program simulates BLOCK neurons (flattened over b x n) for all t_len steps, keeping the state in registers
+    # Offsets are int64 as b * t * n overflows int32 for large conv layers
+    idx = tl.program_id(0).to(tl.int64) * BLOCK + tl.arange(0, BLOCK)
+    valid = idx < n_neurons
+    b_idx = idx // n
+    n_idx = idx % n
+    current_ptrs = current_ptr + b_idx * stride_cb + n_idx * stride_cn
+    # Outputs are stored b x t x n so that neighbouring neurons are written contiguously
+    out_offsets = b_idx * t_len * n + n_idx
+
+    beta = tl.load(beta_ptr + n_idx * stride_beta, mask=valid, other=0.).to(tl.float32)
+    if HAS_V_INIT:
+        mem = tl.load(v_init_ptr + idx, mask=valid, other=0.).to(tl.float32)
+    else:
+        mem = tl.zeros([BLOCK], dtype=tl.float32)
+    spike_mask = tl.zeros([BLOCK], dtype=tl.float32)
+
+    for t in range(t_len):
+        new_mem = beta * mem + tl.load(current_ptrs + t * stride_ct, mask=valid, other=0.).to(tl.float32)
+        spikes = ((new_mem - 1) > 0).to(tl.float32)
+
+        if SINGLE_SPIKE:
+            spikes = spikes * (1 - spike_mask)
+            if not INTEGRATOR:
+                tl.store(pre_mem_ptr + out_offsets + t * n, new_mem, mask=valid)
+                new_mem = new_mem * (1 - spike_mask)
+            spike_mask = tl.maximum(spike_mask, spikes)
+
+        tl.store(spikes_ptr + out_offsets + t * n, spikes.to(spikes_ptr.dtype.element_ty), mask=valid)
+        tl.store(mem_ptr + out_offsets + t * n, new_mem, mask=valid)
+
+        if SINGLE_SPIKE:
+            mem = new_mem
+        else:
+            mem = new_mem - spikes
+
+    if SINGLE_SPIKE:
+        tl.store(mask_ptr + idx, spike_mask, mask=valid)
+
+
+@triton.jit
+def _multistep_lif_bwd_kernel(grad_spikes_ptr, grad_mem_ptr, spikes_ptr, mem_ptr, pre_mem_ptr, mask_ptr, beta_ptr, v_init_ptr,
+                              grad_current_ptr, grad_beta_ptr, grad_v_init_ptr, scale,
+                              n_neurons, n, t_len, stride_gsb, stride_gsn, stride_gst, stride_gmb, stride_gmn, stride_gmt, stride_beta,
+                              HAS_GRAD_SPIKES: tl.constexpr, HAS_GRAD_MEM: tl.constexpr, HAS_V_INIT: tl.constexpr,
+                              SINGLE_SPIKE: tl.constexpr, INTEGRATOR: tl.constexpr, BLOCK: tl.constexpr):
+    # Reverse-time BPTT of _multistep_lif_fwd_kernel, reproducing the gradients autograd computes for MethodStandard
+    # (including those flowing through the single-spike mask and torch.maximum's tie splitting)
+    # Offsets are int64 as b * t * n overflows int32 for large conv layers
+    idx = tl.program_id(0).to(tl.int64) * BLOCK + tl.arange(0, BLOCK)
+    valid = idx < n_neurons
+    b_idx = idx // n
+    n_idx = idx % n
+    out_offsets = b_idx * t_len * n + n_idx
+
+    beta = tl.load(beta_ptr + n_idx * stride_beta, mask=valid, other=0.).to(tl.float32)
+    if HAS_V_INIT:
+        v_init = tl.load(v_init_ptr + idx, mask=valid, other=0.).to(tl.float32)
+    else:
+        v_init = tl.zeros([BLOCK], dtype=tl.float32)
+    if SINGLE_SPIKE:
+        spike_mask = tl.load(mask_ptr + idx, mask=valid, other=0.)
+
+    grad_next = tl.zeros([BLOCK], dtype=tl.float32)  # dL/d(new_mem) of step t + 1
+    grad_mask = tl.zeros([BLOCK], dtype=tl.float32)  # dL/d(spike_mask) after step t
+    grad_beta = tl.zeros([BLOCK], dtype=tl.float32)
+
+    for i in range(t_len):
+        t = t_len - 1 - i
+        mem = tl.load(mem_ptr + out_offsets + t * n, mask=valid, other=0.)
+        spikes = tl.load(spikes_ptr + out_offsets + t * n, mask=valid, other=0.).to(tl.float32)
+        if SINGLE_SPIKE and not INTEGRATOR:
+            pre_mem = tl.load(pre_mem_ptr + out_offsets + t * n, mask=valid, other=0.)
+        else:
+            pre_mem = mem
+
+        if HAS_GRAD_SPIKES:
+            grad_spikes = tl.load(grad_spikes_ptr + b_idx * stride_gsb + n_idx * stride_gsn + t * stride_gst, mask=valid, other=0.).to(tl.float32)
+        else:
+            grad_spikes = tl.zeros([BLOCK], dtype=tl.float32)
+        if HAS_GRAD_MEM:
+            grad_mem = tl.load(grad_mem_ptr + b_idx * stride_gmb + n_idx * stride_gmn + t * stride_gmt, mask=valid, other=0.).to(tl.float32)
+        else:
+            grad_mem = tl.zeros([BLOCK], dtype=tl.float32)
+
+        # FastSigmoid surrogate
+        x = pre_mem - 1
+        surrogate = 1 / (scale * tl.abs(x) + 1) / (scale * tl.abs(x) + 1)
+
+        if SINGLE_SPIKE:
+            grad_out_mem = grad_mem + beta * grad_next
+            raw_spikes = (x > 0).to(tl.float32)
+            prev_mask = spike_mask - spikes
+
+            # spike_mask = maximum(prev_mask, spikes)
+            grad_prev_mask = tl.where(prev_mask > spikes, grad_mask, tl.where(prev_mask == spikes, 0.5 * grad_mask, 0.))
+            grad_spikes += tl.where(prev_mask < spikes, grad_mask, tl.where(prev_mask == spikes, 0.5 * grad_mask, 0.))
+
+            # spikes = raw_spikes * (1 - prev_mask)
+            grad_prev_mask -= grad_spikes * raw_spikes
+            grad_new_mem = grad_spikes * (1 - prev_mask) * surrogate
+
+            # new_mem = new_mem * (1 - prev_mask)
+            if INTEGRATOR:
+                grad_new_mem += grad_out_mem
+            else:
+                grad_new_mem += grad_out_mem * (1 - prev_mask)
+                grad_prev_mask -= grad_out_mem * pre_mem
+
+            grad_mask = grad_prev_mask
+            spike_mask = prev_mask
+        else:
+            # The returned mem is taken before the reset mem = new_mem - spikes
+            grad_new_mem = grad_mem + grad_spikes * surrogate + beta * grad_next * (1 - surrogate)
+
+        tl.store(grad_current_ptr + out_offsets + t * n, grad_new_mem, mask=valid)
+
+        # Membrane potential carried into step t
+        prev_valid = valid & (t > 0)
+        prev_mem = tl.load(mem_ptr + out_offsets + (t - 1) * n, mask=prev_valid, other=0.)
+        if not SINGLE_SPIKE:
+            prev_mem -= tl.load(spikes_ptr + out_offsets + (t - 1) * n, mask=prev_valid, other=0.).to(tl.float32)
+        prev_mem = tl.where(t > 0, prev_mem, v_init)
+
+        grad_beta += grad_new_mem * prev_mem
+        grad_next = grad_new_mem
+
+    tl.store(grad_beta_ptr + idx, grad_beta, mask=valid)
+    if HAS_V_INIT:
+        tl.store(grad_v_init_ptr + idx, beta * grad_next, mask=valid)
+
+
+@torch.library.custom_op("block::fast_sigmoid_forward", mutates_args=())
+def fast_sigmoid_forward(input: torch.Tensor, scale: float) -> Tuple[torch.Tensor, torch.Tensor]:
+    # Returns the spikes and the fp16 surrogate denominator scale * |input| + 1 needed by the backward pass
+    input = input.contiguous()
+    out = torch.empty_like(input)
+    denominator = torch.empty_like(input, dtype=torch.float16)
+    grid = (triton.cdiv(input.numel(), _ELEMENTWISE_BLOCK),)
+    _fast_sigmoid_fwd_kernel[grid](input, out, denominator, scale, input.numel(), BLOCK=_ELEMENTWISE_BLOCK)
+
+    return out, denominator
+
+
+@fast_sigmoid_forward.register_fake
+def _(input, scale):
+    return torch.empty_like(input, memory_format=torch.contiguous_format), torch.empty_like(input, dtype=torch.float16, memory_format=torch.contiguous_format)
+
+
+@torch.library.custom_op("block::fast_sigmoid_backward", mutates_args=())
+def fast_sigmoid_backward(grad_output: torch.Tensor, denominator: torch.Tensor) -> torch.Tensor:
+    grad_output = grad_output.contiguous()
+    grad_input = torch.empty_like(grad_output)
+    grid = (triton.cdiv(grad_output.numel(), _ELEMENTWISE_BLOCK),)
+    _fast_sigmoid_bwd_kernel[grid](grad_output, denominator, grad_input, grad_output.numel(), BLOCK=_ELEMENTWISE_BLOCK)
+
+    return grad_input
+
+
+@fast_sigmoid_backward.register_fake
+def _(grad_output, denominator):
+    return torch.empty_like(grad_output, memory_format=torch.contiguous_format)
+
+
+@torch.library.custom_op("block::multistep_lif_forward", mutates_args=())
+def multistep_lif_forward(current: torch.Tensor, beta: torch.Tensor, v_init: Optional[torch.Tensor], scale: float, single_spike: bool,
+                          integrator: bool) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+    # current: b x n x t
+    # beta: 1 or n
+    # v_init: b x n
+    # Returns spikes and mem (b x t x n), plus the pre-mask membrane potentials and final spike mask that the backward
+    # pass needs for single spike neurons (empty otherwise)
+    b, n, t_len = current.shape
+    n_neurons = b * n
+    if v_init is not None:
+        v_init = v_init.contiguous()
+
+    spikes = torch.empty(b, t_len, n, dtype=current.dtype, device=current.device)
+    mem = torch.empty(b, t_len, n, dtype=torch.float32, device=current.device)
+    pre_mem = torch.empty_like(mem) if single_spike and not integrator else mem.new_empty(0)
+    spike_mask = torch.empty(n_neurons, dtype=torch.float32, device=current.device) if single_spike else mem.new_empty(0)
+
+    grid = (triton.cdiv(n_neurons, _BLOCK),)
+    _multistep_lif_fwd_kernel[grid](current, beta, v_init if v_init is not None else current, spikes, mem,
+                                    pre_mem if pre_mem.numel() else mem, spike_mask if spike_mask.numel() else mem,
+                                    n_neurons, n, t_len, *current.stride(), beta.stride(0) if len(beta) > 1 else 0,
+                                    HAS_V_INIT=v_init is not None, SINGLE_SPIKE=single_spike, INTEGRATOR=integrator, BLOCK=_BLOCK)
+
+    return spikes, mem, pre_mem, spike_mask
+
+
+@multistep_lif_forward.register_fake
+def _(current, beta, v_init, scale, single_spike, integrator):
+    b, n, t_len = current.shape
+    mem = current.new_empty(b, t_len, n, dtype=torch.float32)
+    pre_mem = torch.empty_like(mem) if single_spike and not integrator else mem.new_empty(0)
+    spike_mask = mem.new_empty(b * n if single_spike else 0)
+
+    return current.new_empty(b, t_len, n), mem, pre_mem, spike_mask
+
+
+def _bnt_strides(x):
+    # Strides of a b x t x n tensor in b, n, t order
+    return (0, 0, 0) if x is None else (x.stride(0), x.stride(2), x.stride(1))
+
+
+@torch.library.custom_op("block::multistep_lif_backward", mutates_args=())
+def multistep_lif_backward(grad_spikes: Optional[torch.Tensor], grad_mem: Optional[torch.Tensor], spikes: torch.Tensor, mem: torch.Tensor,
+                           pre_mem: torch.Tensor, spike_mask: torch.Tensor, beta: torch.Tensor, v_init: Optional[torch.Tensor], scale: float,
+                           single_spike: bool, integrator: bool) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    # Returns the gradients of current (b x n x t), beta and v_init (empty without v_init)
+    b, t_len, n = spikes.shape
+    n_neurons = b * n
+
+    grad_current = torch.empty(b, t_len, n, dtype=torch.float32, device=spikes.device)
+    grad_beta = torch.empty(b, n, dtype=torch.float32, device=spikes.device)
+    grad_v_init = torch.empty(b, n, dtype=torch.float32, device=spikes.device) if v_init is not None else None
+
+    grid = (triton.cdiv(n_neurons, _BLOCK),)
+    _multistep_lif_bwd_kernel[grid](grad_spikes if grad_spikes is not None else spikes, grad_mem if grad_mem is not None else mem,
+                                    spikes, mem, pre_mem if pre_mem.numel() else mem, spike_mask if spike_mask.numel() else mem,
+                                    beta, v_init if v_init is not None else mem,
+                                    grad_current, grad_beta, grad_v_init if v_init is not None else grad_beta, scale,
+                                    n_neurons, n, t_len,
+                                    *_bnt_strides(grad_spikes), *_bnt_strides(grad_mem),
+                                    beta.stride(0) if len(beta) > 1 else 0,
+                                    HAS_GRAD_SPIKES=grad_spikes is not None, HAS_GRAD_MEM=grad_mem is not None, HAS_V_INIT=v_init is not None,
+                                    SINGLE_SPIKE=single_spike, INTEGRATOR=integrator, BLOCK=_BLOCK)
+
+    grad_beta = grad_beta.sum(0) if len(beta) > 1 else grad_beta.sum().view(1)
+    grad_v_init = grad_v_init.to(v_init.dtype) if v_init is not None else spikes.new_empty(0)
+
+    return grad_current.transpose(1, 2).to(spikes.dtype), grad_beta.to(beta.dtype), grad_v_init
+
+
+@multistep_lif_backward.register_fake
+def _(grad_spikes, grad_mem, spikes, mem, pre_mem, spike_mask, beta, v_init, scale, single_spike, integrator):
+    b, t_len, n = spikes.shape
+    grad_v_init = v_init.new_empty(b, n) if v_init is not None else spikes.new_empty(0)
+
+    return spikes.new_empty(b, t_len, n).transpose(1, 2), torch.empty_like(beta, memory_format=torch.contiguous_format), grad_v_init
+
+
+def _multistep_lif_setup_context(ctx, inputs, output):
+    current, beta, v_init, scale, single_spike, integrator = inputs
+    spikes, mem, pre_mem, spike_mask = output
+    ctx.save_for_backward(beta, v_init, spikes, mem, pre_mem, spike_mask)
+    ctx.scale = scale
+    ctx.single_spike = single_spike
+    ctx.integrator = integrator
+
+
+def _multistep_lif_backward(ctx, grad_spikes, grad_mem, grad_pre_mem, grad_spike_mask):
+    beta, v_init, spikes, mem, pre_mem, spike_mask = ctx.saved_tensors
+    grad_current, grad_beta, grad_v_init = multistep_lif_backward(grad_spikes, grad_mem, spikes, mem, pre_mem, spike_mask, beta, v_init,
+                                                                  ctx.scale, ctx.single_spike, ctx.integrator)
+
+    return grad_current, grad_beta, grad_v_init if v_init is not None else None, None, None, None
+
+
+multistep_lif_forward.register_autograd(_multistep_lif_backward, setup_context=_multistep_lif_setup_context)
+
+
+def multistep_lif(current, beta, v_init, scale, single_spike, integrator):
+    # Simulates the LIF neurons for all t_len steps with the FastSigmoid surrogate gradient
+    # spikes, mem: b x t x n
+    spikes, mem, _, _ = multistep_lif_forward(current, beta, v_init, float(scale), single_spike, integrator)
+
+    return spikes, mem.to(current.dtype)
@@ -1,10 +1,13 @@
+import functools
+import math
+
 import torch
 from torch import Tensor, dtype
 import torch.nn as nn
-import numpy as np
 from brainbox.models import BBModel
 
 from block.nn.surrogate import FastSigmoid
+from block.nn.functional import linear1d
 import block.nn.methods as methods
 
 
@@ -27,19 +30,25 @@ class BaseNeurons(BBModel):
         self._beta = nn.Parameter(data=torch.Tensor(beta_init), requires_grad=beta_requires_grad)
         self._method_func = self._get_method_func(t_len, **kwargs)
 
-    @property
+    @functools.cached_property
     def hyperparams(self):
         return {**super().hyperparams, "method": self._method, "t_len": self._t_len, "beta_init": self._beta_init, "beta_requires_grad": self._beta_requires_grad, "spike_func": self._spike_func.__class__.__name__}
 
     @property
     def beta(self):
+        # Clamped on every access (a single small kernel per forward) so that any write to _beta, including through
+        # .data, is picked up
         return torch.clamp(self._beta, min=0.00, max=1)
 
     def forward(self, x, v_init=None, return_type=methods.RETURN_SPIKES):
         # current: b x n x t
         # beta: n
         # v_init: b x n
-        return self._method_func(x, self.beta, v_init, return_type)
+        # Under autocast only the input projections run in reduced precision, the membrane dynamics stay in (at least) fp32
+        if x.dtype in (torch.float16, torch.bfloat16):
+            x = x.float()
+        with torch.autocast(x.device.type, enabled=False):
+            return self._method_func(x, self.beta, v_init, return_type)
 
     def get_recurrent_current(self, spikes):
         raise NotImplementedError
@@ -51,7 +60,9 @@ class BaseNeurons(BBModel):
         elif self._method == METHOD_FAST_NAIVE:
             return methods.MethodFastNaive(t_len, self._spike_func, self._scale, self.beta)
         elif self._method == METHOD_FAST_OPTIMISED:
-            raise NotImplementedError
+            if kwargs.get("recurrent", False):
+                raise NotImplementedError
+            return methods.MethodFastTriton(t_len, self._spike_func, self._scale, kwargs.get("single_spike", False), kwargs.get("integrator", False))
 
 
 class LinearNeurons(BaseNeurons):
@@ -63,10 +74,11 @@ class LinearNeurons(BaseNeurons):
 
         self._to_current = nn.Linear(n_in, n_out)
         #self._to_recurrent_current = nn.Linear(n_out, n_out)
-        self.init_weight(self._to_current.weight, "uniform", a=-np.sqrt(1 / n_in), b=np.sqrt(1 / n_in))
-        self.init_weight(self._to_current.bias, "constant", c=0)
+        bound = math.sqrt(1 / n_in)
+        nn.init.uniform_(self._to_current.weight, -bound, bound)
+        nn.init.zeros_(self._to_current.bias)
 
-    @property
+    @functools.cached_property
     def hyperparams(self):
         return {**super().hyperparams, "n_in": self._n_in, "n_out": self._n_out}
 
@@ -74,9 +86,7 @@ class LinearNeurons(BaseNeurons):
     #     return self._to_recurrent_current(spikes)
 
     def forward(self, x, v_init=None, return_type=methods.RETURN_SPIKES):
-        x = x.permute(0, 2, 1)
-        current = self._to_current(x)
-        current = current.permute(0, 2, 1)
+        current = linear1d(x, self._to_current.weight, self._to_current.bias)
         spikes = super().forward(current, v_init, return_type)
 
         return spikes
@@ -97,21 +107,26 @@ class ConvNeurons(BaseNeurons):
         sc = kwargs.get("sc", 1)
         if sc is not None:
             n_in = kernel * kernel * n_in
-            self.init_weight(self._to_current.weight, "uniform", a=-sc*np.sqrt(1 / n_in), b=sc*np.sqrt(1 / n_in))
+            bound = sc * math.sqrt(1 / n_in)
+            nn.init.uniform_(self._to_current.weight, -bound, bound)
         else:
             self.init_weight(self._to_current.weight, "glorot_normal")
-        self.init_weight(self._to_current.bias, "constant", c=0)
+        nn.init.zeros_(self._to_current.bias)
+        # NDHWC lets cuDNN run its native kernels without layout conversions around every conv
+        self._to_current.to(memory_format=torch.channels_last_3d)
 
-    @property
+    @functools.cached_property
     def hyperparams(self):
         return {**super().hyperparams, "n_in": self._n_in, "n_out": self._n_out, "kernel": self._kernel, "stride": self._stride}
 
     def forward(self, x, v_init=None, return_type=methods.RETURN_SPIKES):
+        x = x.contiguous(memory_format=torch.channels_last_3d)
         current = self._to_current(x)
         b, n, t, h, w = current.shape
 
-        current = current.permute(0, 1, 3, 4, 2)
-        current = current.flatten(start_dim=1, end_dim=3)
+        # The channels-last output is b x t x h x w x n in memory, so keeping the (n, h, w) neuron order takes one copy.
+        # It is made time-major (b x t x n*h*w) so each step only transposes an h*w x n slab and reads contiguously
+        current = current.transpose(1, 2).reshape(b, t, n * h * w).transpose(1, 2)
         spikes = super().forward(current, v_init, return_type)
 
         if not self._flatten:
@@ -127,32 +142,36 @@ class PolyNeurons(BaseNeurons):
         self._n_in = n_in
         self._n_out = n_out
 
-        self.fc1 = nn.Linear(n_in, n_out)
-        self.fc2 = nn.Linear(n_in, n_out)
-        self.init_weight(self.fc1.weight, "uniform", a=-np.sqrt(1 / n_in), b=np.sqrt(1 / n_in))
-        self.init_weight(self.fc1.bias, "constant", c=0)
-        self.init_weight(self.fc2.weight, "uniform", a=-np.sqrt(1 / n_in), b=np.sqrt(1 / n_in))
-        self.init_weight(self.fc2.bias, "constant", c=0)
+        # fc1 and fc2 stacked along the output dim ([:n_out] -> fc1, [n_out:] -> fc2) so both are computed in one GEMM
+        self.fc = nn.Linear(n_in, 2 * n_out)
+        bound = math.sqrt(1 / n_in)
+        nn.init.uniform_(self.fc.weight, -bound, bound)
+        nn.init.zeros_(self.fc.bias)
 
 
-    @property
+    @functools.cached_property
     def hyperparams(self):
         return {**super().hyperparams, "n_in": self._n_in, "n_out": self._n_out}
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # Checkpoints saved before fc1 and fc2 were merged into fc store them as separate layers
+        for name in ["weight", "bias"]:
+            if f"{prefix}fc1.{name}" in state_dict:
+                state_dict[f"{prefix}fc.{name}"] = torch.cat([state_dict.pop(f"{prefix}fc1.{name}"), state_dict.pop(f"{prefix}fc2.{name}")])
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     # def get_recurrent_current(self, spikes):
     #     return self._to_recurrent_current(spikes)
     
     def _to_current(self, x):
+        fc1_x, fc2_x = linear1d(x, self.fc.weight, self.fc.bias).chunk(2, dim=1)
         # "Polynomial Neural Networks" formulation:
-        return (self.fc2(x)+1) * self.fc1(x)
+        return (fc2_x + 1) * fc1_x
         # Alternative formulation:
-        # return self.fc1(x) + (self.fc2(x))**2
+        # return fc1_x + fc2_x**2
 
     def forward(self, x, v_init=None, return_type=methods.RETURN_SPIKES):
-
-        x = x.permute(0, 2, 1)
         current = self._to_current(x)
-        current = current.permute(0, 2, 1)
         spikes = super().forward(current, v_init, return_type)
 
         return spikes
@@ -167,33 +186,44 @@ class PolyConvNeurons(BaseNeurons):
         self._stride = stride
         self._flatten = kwargs.get("flatten", False)
 
-        self.conv_1 = nn.Conv3d(n_in, n_out, (1, kernel, kernel), (1, stride, stride))
-        self.conv_2 = nn.Conv3d(n_in, n_out, (1, kernel, kernel), (1, stride, stride))
-
-        #self._to_current = QuadConv(n_in, n_out, (1, kernel, kernel), (1, stride, stride))
-        self._to_current = lambda x: self.conv_1(x) * (1 + self.conv_2(x))
+        # conv_1 and conv_2 stacked along the output channels ([:n_out] -> conv_1, [n_out:] -> conv_2) so both are computed in one conv
+        self.conv = nn.Conv3d(n_in, 2 * n_out, (1, kernel, kernel), (1, stride, stride))
 
         sc = kwargs.get("sc", 1)
         if sc is not None:
-            n_in = kernel * kernel * n_in
-            self.init_weight(self.conv_1.weight, "uniform", a=-sc*np.sqrt(1 / n_in), b=sc*np.sqrt(1 / n_in))
-            self.init_weight(self.conv_2.weight, "uniform", a=-sc*np.sqrt(1 / n_in), b=sc*np.sqrt(1 / n_in))
+            bound = sc * math.sqrt(1 / (kernel * kernel * n_in))
+            nn.init.uniform_(self.conv.weight, -bound, bound)
         else:
-            self.init_weight(self.conv_1.weight, "glorot_normal")
-            self.init_weight(self.conv_2.weight, "glorot_normal")
-        self.init_weight(self.conv_1.bias, "constant", c=0)
-        self.init_weight(self.conv_2.bias, "constant", c=0)
-
-    @property
+            # Each half is initialised on its own so that it matches a standalone n_out channel conv
+            for weight in self.conv.weight.data.chunk(2):
+                self.init_weight(weight, "glorot_normal")
+        nn.init.zeros_(self.conv.bias)
+        # NDHWC lets cuDNN run its native kernels without layout conversions around every conv
+        self.conv.to(memory_format=torch.channels_last_3d)
+
+    @functools.cached_property
     def hyperparams(self):
         return {**super().hyperparams, "n_in": self._n_in, "n_out": self._n_out, "kernel": self._kernel, "stride": self._stride}
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # Checkpoints saved before conv_1 and conv_2 were merged into conv store them as separate layers
+        for name in ["weight", "bias"]:
+            if f"{prefix}conv_1.{name}" in state_dict:
+                state_dict[f"{prefix}conv.{name}"] = torch.cat([state_dict.pop(f"{prefix}conv_1.{name}"), state_dict.pop(f"{prefix}conv_2.{name}")])
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def _to_current(self, x):
+        conv_1_x, conv_2_x = self.conv(x).chunk(2, dim=1)
+        return conv_1_x * (1 + conv_2_x)
+
     def forward(self, x, v_init=None, return_type=methods.RETURN_SPIKES):
+        x = x.contiguous(memory_format=torch.channels_last_3d)
         current = self._to_current(x)
         b, n, t, h, w = current.shape
 
-        current = current.permute(0, 1, 3, 4, 2)
-        current = current.flatten(start_dim=1, end_dim=3)
+        # The channels-last output is b x t x h x w x n in memory, so keeping the (n, h, w) neuron order takes one copy.
+        # It is made time-major (b x t x n*h*w) so each step only transposes an h*w x n slab and reads contiguously
+        current = current.transpose(1, 2).reshape(b, t, n * h * w).transpose(1, 2)
         spikes = super().forward(current, v_init, return_type)
 
         if not self._flatten:
@@ -5,6 +5,12 @@ from brainbox.models import BBModel
 
 
 from block.nn.functional import bconv1d
+from block.nn.surrogate import FastSigmoid
+
+try:
+    from block.nn.kernels import multistep_lif
+except ImportError:
+    multistep_lif = None
 
 
 RETURN_SPIKES = 0
@@ -12,6 +18,20 @@ RETURN_SPIKES_AND_MEM = 1
 RETURN_ALL = 2
 
 
+def lif_step(mem, current, beta, spike_func, scale, recurrent_current=None):
+    # Leaky integration of one step of input current, then spiking at threshold 1 (resetting is left to the caller)
+    if mem is None:
+        # Copied as the caller resets new_mem in place, which must not write through to the input current
+        new_mem = current.clone()
+    else:
+        new_mem = torch.einsum("bn...,n->bn...", mem, beta) + current
+
+        if recurrent_current is not None:
+            new_mem += recurrent_current
+
+    return new_mem, spike_func(new_mem - 1, scale)
+
+
 class BaseMethod(BBModel):
 
     def __init__(self, t_len, spike_func, scale):
@@ -47,17 +67,9 @@ class MethodStandard(BaseMethod):
         spikes_list = []
 
         for t in range(self._t_len):
-            # Update membrane potential
-            if mem is None:
-                new_mem = current[:, :, t]
-            else:
-                new_mem = torch.einsum("bn...,n->bn...", mem, beta) + current[:, :, t]
-
-                if self._recurrent_source is not None:
-                    new_mem += self._recurrent_source(spikes.detach())
-
-            # To spike or not to spike
-            spikes = self._spike_func(new_mem - 1, self._scale)
+            # Update membrane potential and to spike or not to spike
+            recurrent_current = self._recurrent_source(spikes.detach()) if self._recurrent_source is not None and mem is not None else None
+            new_mem, spikes = lif_step(mem, current[:, :, t], beta, self._spike_func, self._scale, recurrent_current)
 
             if self._single_spike:
                 if spike_mask is None:
@@ -75,12 +87,15 @@ class MethodStandard(BaseMethod):
                 new_mem -= spikes
             mem = new_mem
 
+        # Stacked time-major (b x t x n in memory) so the next layer's linear1d is a single GEMM
+        spikes = torch.stack(spikes_list, dim=1).transpose(1, 2)
+
         if return_type == RETURN_SPIKES:
-            return torch.stack(spikes_list, dim=2)
+            return spikes
         elif return_type == RETURN_SPIKES_AND_MEM:
-            return torch.stack(spikes_list, dim=2), torch.stack(mem_list, dim=2)
+            return spikes, torch.stack(mem_list, dim=1).transpose(1, 2)
         elif return_type == RETURN_ALL:
-            return torch.stack(spikes_list, dim=2), torch.stack(mem_list, dim=2), current
+            return spikes, torch.stack(mem_list, dim=1).transpose(1, 2), current
 
 
 class MethodFastNaive(BaseMethod):
@@ -138,3 +153,34 @@ class MethodFastNaive(BaseMethod):
     def _build_beta_kernel(self, beta):
         beta_base = beta.unsqueeze(1).multiply(self._beta_ident_base)
         return torch.pow(beta_base, self._beta_exp).unsqueeze(1).unsqueeze(1)
+
+
+class MethodFastTriton(BaseMethod):
+
+    # Simulates all t_len steps of the LIF neurons in a single Triton kernel (and BPTT in another), producing the same
+    # spikes, membrane potentials and gradients as MethodStandard with the FastSigmoid surrogate gradient
+    def __init__(self, t_len, spike_func, scale, single_spike=False, integrator=False):
+        if multistep_lif is None:
+            raise ImportError("MethodFastTriton requires triton and PyTorch >= 2.4 to be installed")
+        if spike_func != FastSigmoid.apply:
+            raise NotImplementedError("MethodFastTriton only implements the FastSigmoid surrogate gradient")
+        super().__init__(t_len, spike_func, scale)
+        self._single_spike = single_spike
+        self._integrator = integrator
+
+    @property
+    def hyperparams(self):
+        return {**super().hyperparams, "single_spike": self._single_spike}
+
+    def forward(self, current, beta, v_init=None, return_type=RETURN_SPIKES):
+        if not current.is_cuda:
+            raise NotImplementedError("MethodFastTriton only runs on CUDA tensors")
+        spikes, mem = multistep_lif(current, beta, v_init, self._scale, self._single_spike, self._integrator)
+        spikes, mem = spikes.transpose(1, 2), mem.transpose(1, 2)
+
+        if return_type == RETURN_SPIKES:
+            return spikes
+        elif return_type == RETURN_SPIKES_AND_MEM:
+            return spikes, mem
+        elif return_type == RETURN_ALL:
+            return spikes, mem, current
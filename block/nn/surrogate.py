@@ -1,21 +1,34 @@
 import torch
 
+try:
+    import block.nn.kernels as kernels
+except ImportError:
+    kernels = None
+
 
 class FastSigmoid(torch.autograd.Function):
 
     @staticmethod
     def forward(ctx, input, scale):
-        ctx.scale = scale
-        ctx.save_for_backward(input)
-        out = torch.zeros_like(input)
-        out[input > 0] = 1.0
+        # Single pass kernels on GPU rather than one kernel per elementwise op (registered as custom ops, so they stay
+        # opaque single nodes under torch.compile)
+        if kernels is not None and input.is_cuda:
+            out, denominator = kernels.fast_sigmoid_forward(input, float(scale))
+        else:
+            out = (input > 0).to(input.dtype)
+            denominator = (scale * torch.abs(input) + 1.0).to(torch.float16)
+
+        # The surrogate gradient tolerates low precision, so only an fp16 denominator is kept for the backward pass
+        ctx.save_for_backward(denominator)
 
         return out
 
     @staticmethod
     def backward(ctx, grad_output):
-        input, = ctx.saved_tensors
-        grad_input = grad_output.clone()
-        grad = grad_input / (ctx.scale * torch.abs(input) + 1.0) ** 2
+        denominator, = ctx.saved_tensors
+        if kernels is not None and denominator.is_cuda:
+            return kernels.fast_sigmoid_backward(grad_output, denominator), None
+
+        grad = grad_output / denominator.float() ** 2
         
         return grad, None
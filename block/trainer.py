@@ -9,13 +9,23 @@ import pandas as pd
 from brainbox import trainer
 
 from block import models, results
+from block.nn.layers import BaseNeurons, PolyNeurons, PolyConvNeurons
+from block.nn.methods import MethodFastTriton
 
 
 class Trainer(trainer.Trainer):
 
+    # Pinned, prefetched batches from persistent workers so host-to-device copies can be issued asynchronously
+    LOADER_KWARGS = {"pin_memory": True, "num_workers": 16, "persistent_workers": True, "prefetch_factor": 4}
+
     def __init__(self, root, model, dataset, n_epochs, batch_size, lr, milestones=[-1], gamma=0.1, val_dataset=None,
-                 device="cuda", dtype=torch.float, track_activity=False, test_track_activity=False, test_dataset=[]):
-        super().__init__(root, model, dataset, n_epochs, batch_size, lr, torch.optim.Adam, device=device, dtype=dtype, loader_kwargs={"shuffle": True, "pin_memory": True,  "num_workers": 16})
+                 device="cuda", dtype=torch.float, track_activity=False, test_track_activity=False, test_dataset=[], autocast_dtype=None, fused_optimizer=False, compile=False):
+        super().__init__(root, model, dataset, n_epochs, batch_size, lr, torch.optim.Adam, optimizer_kwargs={"fused": True} if fused_optimizer else {}, device=device, dtype=dtype, loader_kwargs={"shuffle": True, **Trainer.LOADER_KWARGS})
+        self._autocast_dtype = autocast_dtype
+        self._copy_stream = torch.cuda.Stream() if torch.device(device).type == "cuda" else None
+        self._compile = compile
+        if compile:
+            Trainer.compile_model(self.model)
         self._milestones = milestones
         self._gamma = gamma
         self._val_dataset = val_dataset
@@ -31,7 +41,7 @@ class Trainer(trainer.Trainer):
         self._min_loss = np.inf
         self._max_test_acc = -1
         self._milestone_idx = 0
-        self.test_data_loader = torch.utils.data.DataLoader(test_dataset, batch_size, shuffle=True) if len(test_dataset) != 0 else torch.utils.data.DataLoader(test_dataset, batch_size, shuffle=False)
+        self.test_data_loader = torch.utils.data.DataLoader(test_dataset, batch_size, shuffle=True, **Trainer.LOADER_KWARGS) if len(test_dataset) != 0 else torch.utils.data.DataLoader(test_dataset, batch_size, shuffle=False)
         self.log["test_acc"] = []
         self._test = (len(test_dataset) != 0)
         if self._test:
@@ -80,6 +90,39 @@ class Trainer(trainer.Trainer):
             activity_df = pd.DataFrame(self._test_activity)
             activity_df.to_csv(self.test_activity_path, index=False)
 
+    def autocast(self):
+        return torch.autocast(torch.device(self.device).type, dtype=self._autocast_dtype, enabled=self._autocast_dtype is not None)
+
+    def prefetch(self, data_loader):
+        # Yields the batches on the device, issuing the pinned non-blocking copy of batch i + 1 on a side stream before
+        # batch i is returned, so that the transfer overlaps batch i's forward and backward passes
+        batches = iter(data_loader)
+        batch = self._copy_to_device(next(batches, None))
+        while batch is not None:
+            next_batch = self._copy_to_device(next(batches, None))
+            (data, target), copied = batch
+            if copied is not None:
+                torch.cuda.current_stream().wait_event(copied)
+                data.record_stream(torch.cuda.current_stream())
+                target.record_stream(torch.cuda.current_stream())
+
+            # Converted on the device, as a dtype change in .to would first convert into pageable host memory
+            yield data.type(self.dtype), target.type(self.dtype)
+            batch = next_batch
+
+    def _copy_to_device(self, batch):
+        if batch is None:
+            return None
+        if self._copy_stream is None:
+            return [x.to(self.device) for x in batch], None
+
+        with torch.cuda.stream(self._copy_stream):
+            batch = [x.to(self.device, non_blocking=True) for x in batch]
+            copied = torch.cuda.Event()
+            copied.record()
+
+        return batch, copied
+
     def loss(self, output, target, model):
         target = target.long()
         loss = F.cross_entropy(output, target)
@@ -92,21 +135,21 @@ class Trainer(trainer.Trainer):
         n_correct = 0
 
         train_start = time.time()
-        for batch_id, (data, target) in enumerate(self.train_data_loader):
-            data = data.to(self.device).type(self.dtype)
-            target = target.to(self.device).type(self.dtype)
-            torch.cuda.synchronize()
+        for batch_id, (data, target) in enumerate(self.prefetch(self.train_data_loader)):
+            # Only the compute stream is synchronised for timing, the next batch's copy keeps running on its own stream
+            torch.cuda.current_stream().synchronize()
 
             # Forward pass
             start_time = time.time()
-            if self._track_activity:
-                output = self.model(data, return_all=True)
-                activity = results.datasets.ResultsBuilderMetric.spike_count(output, None)
-                self._activity.append(activity / data.shape[0])
-                output = output[0]
-            else:
-                output = self.model(data)
-            torch.cuda.synchronize()
+            with self.autocast():
+                if self._track_activity:
+                    output = self.model(data, return_all=True)
+                    activity = results.datasets.ResultsBuilderMetric.spike_count(output, None)
+                    self._activity.append(activity / data.shape[0])
+                    output = output[0]
+                else:
+                    output = self.model(data)
+            torch.cuda.current_stream().synchronize()
             forward_pass_time = time.time() - start_time
             self._times["forward_pass"].append(forward_pass_time)
 
@@ -120,12 +163,12 @@ class Trainer(trainer.Trainer):
             # Backward pass
             start_time = time.time()
             loss.backward()
-            torch.cuda.synchronize()
+            torch.cuda.current_stream().synchronize()
             backward_pass_time = time.time() - start_time
             self._times["backward_pass"].append(backward_pass_time)
 
             self.optimizer.step()
-            self.optimizer.zero_grad()
+            self.optimizer.zero_grad(set_to_none=True)
 
             with torch.no_grad():
                 epoch_loss += (loss.item() * data.shape[0])
@@ -140,21 +183,20 @@ class Trainer(trainer.Trainer):
             test_samples = 0
             
             test_start = time.time()
-            for batch_id, (data, target) in enumerate(self.test_data_loader):
-                data = data.to(self.device).type(self.dtype)
-                target = target.to(self.device).type(self.dtype)
-                torch.cuda.synchronize()
+            for batch_id, (data, target) in enumerate(self.prefetch(self.test_data_loader)):
+                torch.cuda.current_stream().synchronize()
     
                 # Forward pass
                 start_time = time.time()
-                if self._test_track_activity:
-                    output = self.model(data, return_all=True)
-                    activity = results.datasets.ResultsBuilderMetric.spike_count(output, None)
-                    self._test_activity.append(activity / data.shape[0])
-                    output = output[0]
-                else:
-                    output = self.model(data)
-                torch.cuda.synchronize()
+                with self.autocast():
+                    if self._test_track_activity:
+                        output = self.model(data, return_all=True)
+                        activity = results.datasets.ResultsBuilderMetric.spike_count(output, None)
+                        self._test_activity.append(activity / data.shape[0])
+                        output = output[0]
+                    else:
+                        output = self.model(data)
+                torch.cuda.current_stream().synchronize()
                 pass_time = time.time() - start_time
                 self._test_times.append(pass_time)
     
@@ -204,6 +246,8 @@ class Trainer(trainer.Trainer):
             self.lr *= self._gamma
             # Load best model
             self.model = Trainer.load_model(self.root, self.id, self.device, self.dtype)
+            if self._compile:
+                Trainer.compile_model(self.model)
             self.optimizer = self.optimizer_func(
                 self.model.parameters(), self.lr, **self.optimizer_kwargs
             )
@@ -216,6 +260,25 @@ class Trainer(trainer.Trainer):
     def on_training_complete(self, save):
         pass
 
+    @staticmethod
+    def compile_model(model):
+        # Every layer compiles the same code objects (MethodStandard.forward, the Poly layers' _to_current), so they share
+        # one cache. Shapes are left to automatic dynamic, which makes the batch and neuron dims symbolic once they change
+        # (t_len stays static, the time loop is unrolled from a Python int), and the recompile limit leaves room for each
+        # layer's remaining specialisations (layout, readout, batch of 1) instead of failing or falling back to eager
+        neurons = [module for module in model.modules() if isinstance(module, BaseNeurons)]
+        torch._dynamo.config.recompile_limit = max(torch._dynamo.config.recompile_limit, 4 * len(neurons))
+
+        for module in neurons:
+            # Fuse the polynomial layers' (a + 1) * b into the kernels producing a and b
+            if isinstance(module, (PolyNeurons, PolyConvNeurons)):
+                module._to_current = torch.compile(module._to_current)
+
+            # The time loop of lif_step calls (surrogate spike included) is unrolled into one graph without breaks, fused
+            # across steps and replayed as a CUDA graph (MethodFastTriton already runs as a single kernel)
+            if not isinstance(module._method_func, MethodFastTriton):
+                module._method_func.compile(fullgraph=True, mode="reduce-overhead")
+
     @staticmethod
     def load_model(root, id, device, dtype):
         return trainer.load_model(root, id, Trainer.model_loader, device, dtype)
@@ -1,10 +1,10 @@
 import os
 import ast
+import math
 import argparse
 from pathlib import Path
 
 import torch
-import numpy as np
 
 from dblock import datasets, models, trainer
 from dblock.datasets.transforms import List
@@ -60,7 +60,8 @@ def get_model(t_len, args):
         model = models.YingYangModel(args.method, t_len, single_spike=single_spike)
         c = 4
         n_in = 4
-        model._model._layers[0].init_weight(model._model._layers[0]._to_current.weight, "uniform", a=-c*np.sqrt(1 / n_in), b=c*np.sqrt(1 / n_in))
+        bound = c * math.sqrt(1 / n_in)
+        torch.nn.init.uniform_(model._model._layers[0]._to_current.weight, -bound, bound)
         milestones = [50, 100]
     elif args.dataset == "mnist":
         if load_conv_model:
@@ -113,6 +114,8 @@ def main():
     parser.add_argument("--lr", type=float, default=0.0002)
     parser.add_argument("--device", type=str, default="cuda")
     parser.add_argument("--track_activity", type=str, default="False")
+    parser.add_argument("--compile", type=str, default="False")
+    parser.add_argument("--bf16", type=str, default="False")
 
     # Load arguments
     args = parser.parse_args()
@@ -136,11 +139,14 @@ def main():
     if track_activity:
         c = 0.1
         n_in = 28*28 if args.dataset == "mnist" else dataset.n_in
-        model._model._layers[0].init_weight(model._model._layers[0]._to_current.weight, "uniform", a=-c*np.sqrt(1 / n_in), b=c*np.sqrt(1 / n_in))
+        bound = c * math.sqrt(1 / n_in)
+        torch.nn.init.uniform_(model._model._layers[0]._to_current.weight, -bound, bound)
 
     transform = List.get_cifar10_transform(args.t_len, use_augmentation=True)
     val_dataset = datasets.CIFAR10Dataset(os.path.join(base_path, "data"), train=False, t_len=args.t_len, transform=transform)
-    snn_trainer = trainer.Trainer(model_results_path, model, dataset, args.epoch, args.batch, args.lr, milestones=milestones, gamma=args.gamma, val_dataset=val_dataset, device=args.device, track_activity=track_activity)
+    autocast_dtype = torch.bfloat16 if ast.literal_eval(args.bf16) else None
+    snn_trainer = trainer.Trainer(model_results_path, model, dataset, args.epoch, args.batch, args.lr, milestones=milestones, gamma=args.gamma, val_dataset=val_dataset, device=args.device, track_activity=track_activity,
+                                  autocast_dtype=autocast_dtype, fused_optimizer=args.device.startswith("cuda"), compile=ast.literal_eval(args.compile))
     snn_trainer.train(save=True)
 
 
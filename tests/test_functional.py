@@ -0,0 +1,19 @@
+import torch
+
+from block.nn.functional import linear1d
+
+
+# Test linear1d
+
+def test_linear1d_matches_linear():
+    # Contiguous b x n x t input (conv1d path)
+    assert _linear1d_identical(torch.rand(8, 20, 30))
+    # Time-major input, b x t x n in memory (collapsed GEMM path)
+    assert _linear1d_identical(torch.rand(8, 30, 20).transpose(1, 2))
+
+
+def _linear1d_identical(x):
+    linear = torch.nn.Linear(x.shape[1], 10)
+    expected = linear(x.permute(0, 2, 1)).permute(0, 2, 1)
+
+    return torch.allclose(linear1d(x, linear.weight, linear.bias), expected)
@@ -1,6 +1,7 @@
 import torch
 
 import block.nn.layers as layers
+import block.nn.methods as methods
 
 
 # Test BaseNeurons
@@ -18,6 +19,23 @@ def test_beta_differentiable():
     assert base_neurons.beta.requires_grad
 
 
+def test_beta_clamp_updates():
+    base_neurons = layers.BaseNeurons(layers.METHOD_STANDARD, 4, beta_init=[0.5, 2])
+    assert torch.allclose(base_neurons.beta, torch.Tensor([0.5, 1]))
+
+    base_neurons.load_state_dict({"_beta": torch.Tensor([-1, 0.5])})
+    assert torch.allclose(base_neurons.beta, torch.Tensor([0, 0.5]))
+
+    base_neurons._beta.data.copy_(torch.Tensor([0.25, 3]))
+    assert torch.allclose(base_neurons.beta, torch.Tensor([0.25, 1]))
+
+
+def test_dynamics_precision():
+    base_neurons = layers.BaseNeurons(layers.METHOD_STANDARD, 4)
+    assert base_neurons(torch.rand(2, 1, 4, dtype=torch.bfloat16)).dtype == torch.float
+    assert base_neurons.double()(torch.rand(2, 1, 4, dtype=torch.double)).dtype == torch.double
+
+
 # Test LinearNeurons
 
 def test_linear_layers_single_beta():
@@ -46,3 +64,39 @@ def _linear_models_identical(use_single_beta):
     fast_linear_output = fast_linear(spikes)
 
     return torch.allclose(van_linear_output, fast_linear_output)
+
+
+# Test PolyNeurons
+
+def test_poly_layer_matches_separate_linears():
+    n_in = 20
+    n_out = 10
+    poly_linear = layers.PolyNeurons(n_in, n_out, layers.METHOD_STANDARD, 8)
+    fc1 = torch.nn.Linear(n_in, n_out)
+    fc2 = torch.nn.Linear(n_in, n_out)
+
+    # Old checkpoints (separate fc1 and fc2) load into the merged layer
+    poly_linear.load_state_dict({"_beta": poly_linear._beta.data, **{f"fc{i}.{name}": param for i, fc in [(1, fc1), (2, fc2)] for name, param in fc.state_dict().items()}})
+
+    x = torch.rand(4, n_in, 8)
+    expected_current = ((fc2(x.permute(0, 2, 1)) + 1) * fc1(x.permute(0, 2, 1))).permute(0, 2, 1)
+    assert torch.allclose(poly_linear._to_current(x), expected_current)
+
+
+# Test PolyConvNeurons
+
+def test_poly_conv_layer_matches_separate_convs():
+    n_in = 3
+    n_out = 4
+    poly_conv = layers.PolyConvNeurons(n_in, n_out, 3, 1, layers.METHOD_STANDARD, 8, flatten=True)
+    conv_1 = torch.nn.Conv3d(n_in, n_out, (1, 3, 3))
+    conv_2 = torch.nn.Conv3d(n_in, n_out, (1, 3, 3))
+
+    # Old checkpoints (separate conv_1 and conv_2) load into the merged layer
+    poly_conv.load_state_dict({"_beta": poly_conv._beta.data, **{f"conv_{i}.{name}": param for i, conv in [(1, conv_1), (2, conv_2)] for name, param in conv.state_dict().items()}})
+
+    # The channels-last current must still be flattened in (n, h, w) neuron order
+    x = torch.rand(2, n_in, 8, 10, 10)
+    _, _, current = poly_conv(x, return_type=methods.RETURN_ALL)
+    expected_current = (conv_1(x) * (1 + conv_2(x))).permute(0, 1, 3, 4, 2).flatten(start_dim=1, end_dim=3)
+    assert torch.allclose(current, expected_current, atol=1e-6)
@@ -1,6 +1,7 @@
+import pytest
 import torch
 
-from block.nn.methods import MethodFastNaive
+from block.nn.methods import MethodStandard, MethodFastNaive, MethodFastTriton, multistep_lif, RETURN_SPIKES_AND_MEM
 from block.nn.surrogate import FastSigmoid
 
 
@@ -32,4 +33,73 @@ def test_differentiable_vars():
     assert not fast_naive._beta_ident_base.requires_grad
     assert not fast_naive._beta_exp.requires_grad
     assert not fast_naive._beta_kernel.requires_grad
-    assert not fast_naive._phi_kernel.requires_grad
\ No newline at end of file
+    assert not fast_naive._phi_kernel.requires_grad
+
+
+# Test MethodStandard
+
+def test_standard_method_preserves_current():
+    current = torch.randn(4, 20, 10) * 2
+    current_copy = current.clone()
+    for single_spike in [False, True]:
+        MethodStandard(10, FastSigmoid.apply, 10, single_spike)(current, torch.rand(20))
+        assert torch.equal(current, current_copy)
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="requires a CUDA device")
+def test_standard_method_compiles_full_graph():
+    t_len = 20
+    current = torch.randn(8, 50, t_len, device="cuda") * 2
+    beta = torch.rand(50, device="cuda")
+
+    outputs = []
+    for compile in [False, True]:
+        method = MethodStandard(t_len, FastSigmoid.apply, 10, single_spike=True)
+        if compile:
+            method.compile(dynamic=False, fullgraph=True)
+        method_current = current.clone().requires_grad_()
+        spikes, mem = method(method_current, beta, return_type=RETURN_SPIKES_AND_MEM)
+        (spikes.sum() + mem.sum()).backward()
+        outputs.append([spikes, mem, method_current.grad])
+
+    assert all(torch.allclose(eager, compiled, atol=1e-4) for eager, compiled in zip(*outputs))
+
+
+# Test MethodFastTriton
+
+@pytest.mark.skipif(multistep_lif is None, reason="requires triton")
+def test_fast_triton_requires_fast_sigmoid():
+    with pytest.raises(NotImplementedError):
+        MethodFastTriton(4, torch.sigmoid, 10)
+
+
+@pytest.mark.skipif(multistep_lif is None, reason="requires triton")
+def test_fast_triton_requires_cuda():
+    with pytest.raises(NotImplementedError):
+        MethodFastTriton(4, FastSigmoid.apply, 10)(torch.rand(2, 3, 4), torch.rand(3))
+
+
+@pytest.mark.skipif(multistep_lif is None or not torch.cuda.is_available(), reason="requires triton and a CUDA device")
+def test_fast_triton_matches_standard():
+    assert _triton_method_identical(single_spike=False, integrator=False)
+    assert _triton_method_identical(single_spike=True, integrator=False)
+    assert _triton_method_identical(single_spike=True, integrator=True)
+
+
+def _triton_method_identical(single_spike, integrator):
+    t_len = 50
+    current = torch.randn(16, 200, t_len, device="cuda")
+    beta = torch.rand(200, device="cuda")
+
+    outputs = []
+    for method in [MethodStandard, MethodFastTriton]:
+        method_current = current.clone().requires_grad_()
+        method_beta = beta.clone().requires_grad_()
+        spikes, mem = method(t_len, FastSigmoid.apply, 10, single_spike, integrator)(method_current * 1, method_beta, return_type=RETURN_SPIKES_AND_MEM)
+        (spikes.sum() + mem.max(2)[0].sum()).backward()
+        outputs.append([spikes, mem, method_current.grad, method_beta.grad])
+
+    # FastSigmoid keeps an fp16 surrogate denominator for backward, so MethodStandard's gradients are only ~1e-3 accurate
+    (standard_spikes, standard_mem, *standard_grads), (fast_spikes, fast_mem, *fast_grads) = outputs
+    return torch.allclose(standard_spikes, fast_spikes) and torch.allclose(standard_mem, fast_mem, atol=1e-4) and \
+        all((standard - fast).abs().max() <= 1e-2 * fast.abs().max() for standard, fast in zip(standard_grads, fast_grads))
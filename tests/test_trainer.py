@@ -0,0 +1,24 @@
+import torch
+
+import block.nn.layers as layers
+from block.trainer import Trainer
+
+
+# Test Trainer.compile_model
+
+def test_compiled_model_over_batch_sizes():
+    t_len = 4
+    model = torch.nn.Sequential(
+        layers.PolyNeurons(20, 30, layers.METHOD_STANDARD, t_len),
+        layers.LinearNeurons(30, 25, layers.METHOD_STANDARD, t_len),
+        layers.PolyNeurons(25, 15, layers.METHOD_STANDARD, t_len),
+        layers.LinearNeurons(15, 10, layers.METHOD_STANDARD, t_len, single_spike=True),
+        layers.LinearNeurons(10, 5, layers.METHOD_STANDARD, t_len, single_spike=True, integrator=True)
+    )
+    Trainer.compile_model(model)
+
+    # Each layer and batch size would otherwise take its own entry in the shared cache of MethodStandard.forward
+    for batch_size in [4, 3, 2, 1, 5]:
+        output = model(torch.rand(batch_size, 20, t_len))
+        output.sum().backward()
+        assert output.shape == (batch_size, 5, t_len)